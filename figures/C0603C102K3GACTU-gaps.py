@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# Plot de-embedded ESR of a capacitor, which contains points that cannot be
+# plotted: subtracting the fixture resistance leaves some values negative and
+# a few readings are missing
+
+from rlc_chart import RLC_Chart
+from inform import fatal, os_error
+from pathlib import Path
+import csv
+
+fmin = 100
+fmax = 10e9
+zmin = 0.001
+zmax = 1e4
+r_fixture = 25e-3
+missing = {50, 100, 101, 103, 150, 200, 250, 300, 350}
+
+frequency = []
+r_data = []
+try:
+    contents = Path('C0603C102K3GACTU_imp_esr.csv').read_text()
+    data = csv.DictReader(contents.splitlines(), delimiter=',')
+    for i, row in enumerate(data):
+        frequency.append(float(row['Frequency']))
+        if i in missing:
+            r_data.append(float('nan'))
+        else:
+            r_data.append(float(row['ESR']) - r_fixture)
+
+    with RLC_Chart('C0603C102K3GACTU-gaps.svg', fmin, fmax, zmin, zmax) as chart:
+        dropped = chart.add_trace(frequency, r_data, stroke='blue')
+        chart.add(chart.text(
+            f"{dropped} of {len(r_data)} points dropped",
+            insert = (chart.WIDTH/2, 36),
+            font_size = 24,
+            fill = 'black',
+            text_anchor = 'middle',
+        ))
+
+except OSError as e:
+    fatal(os_error(e))
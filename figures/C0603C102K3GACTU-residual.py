@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# Compare measured impedance of a capacitor against its model on the pixel grid
+
+from rlc_chart import RLC_Chart, resample, residual
+from inform import fatal, os_error
+from pathlib import Path
+import numpy as np
+import csv
+
+fmin = 100
+fmax = 10e9
+zmin = 0.01
+zmax = 1e6
+cmod = 1e-9
+lmod = 700e-12
+rmod = 20e-3
+
+def model(f):
+    jω = 2j*np.pi*f
+    return 1/(jω*cmod) + rmod + jω*lmod
+
+try:
+    contents = Path('C0603C102K3GACTU_imp_esr.csv').read_text()
+    data = list(csv.DictReader(contents.splitlines(), delimiter=','))
+    frequency = np.array([float(row['Frequency']) for row in data])
+    z_data = np.array([float(row['Impedance']) for row in data])
+
+    with RLC_Chart('C0603C102K3GACTU-residual.svg', fmin, fmax, zmin, zmax) as chart:
+        freq = chart.pixel_frequencies()
+        z_model = np.abs(model(freq))
+        z_measured = resample(frequency, z_data, freq)
+
+        chart.add_band(freq, z_measured, z_model, fill='red')
+        chart.add_trace(freq, z_measured, stroke='red')
+        chart.add_trace(freq, z_model, stroke='red', stroke_dasharray=(10,5))
+        chart.add_trace(
+            freq, residual(freq, z_measured, freq, z_model), stroke='blue'
+        )
+
+except OSError as e:
+    fatal(os_error(e))
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# Tune the model of a capacitor using a session, keeping the final chart
+
+from rlc_chart import RLC_Session
+from inform import fatal, os_error
+from pathlib import Path
+import numpy as np
+import csv
+
+fmin = 100
+fmax = 10e9
+zmin = 0.01
+zmax = 1e6
+
+def model(f, rs, c, l):
+    jω = 2j*np.pi*f
+    return 1/(jω*c) + rs + jω*l
+
+try:
+    contents = Path('C0603C102K3GACTU_imp_esr.csv').read_text()
+    data = list(csv.DictReader(contents.splitlines(), delimiter=','))
+    frequency = [float(row['Frequency']) for row in data]
+    z_data = [float(row['Impedance']) for row in data]
+
+    session = RLC_Session(
+        'C0603C102K3GACTU-session.svg', fmin, fmax, zmin, zmax, model,
+        model_args = dict(stroke='red', stroke_dasharray=(10,5)),
+    )
+    session.add_trace(frequency, z_data, stroke='red')
+
+    # step the inductance toward its final value, then revisit a cached value
+    for l in [500e-12, 600e-12, 700e-12, 600e-12]:
+        session.render(rs=20e-3, c=1e-9, l=l)
+    session.save(rs=20e-3, c=1e-9, l=700e-12)
+
+except OSError as e:
+    fatal(os_error(e))
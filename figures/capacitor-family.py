@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# Annotate the capacitance and resonant frequency of every part in a family of
+# ceramic capacitors that share the same package inductance
+
+from rlc_chart import RLC_Chart
+from inform import fatal, os_error
+from quantiphy import Quantity
+import numpy as np
+
+fmin = 100e3
+fmax = 10e9
+zmin = 0.01
+zmax = 1e3
+lpkg = 700e-12
+e6 = [1, 1.5, 2.2, 3.3, 4.7, 6.8]
+caps = np.array([m*10**e for e in range(-11, -6) for m in e6])
+f0 = 1/(2*np.pi*np.sqrt(lpkg*caps))
+
+try:
+    with RLC_Chart('capacitor-family.svg', fmin, fmax, zmin, zmax, axes='fz') as chart:
+        # capacitance of each part, up to its resonant frequency
+        chart.add_lines(fmin, f0, c=caps, stroke='blue')
+
+        # package inductance
+        chart.add_line(f0.min(), fmax, l=lpkg, stroke='red')
+
+        # resonant frequency markers and labels
+        z0 = 2*np.pi*f0*lpkg
+        chart.add_lines(zmin, z0, f=f0, stroke='grey', stroke_dasharray=(4,4))
+        decade = np.array([m == 1 for e in range(-11, -6) for m in e6])
+        chart.add_labels(
+            [Quantity(c, 'F') for c in caps[decade]], f0[decade], 1.5*zmin,
+            font_size = 8,
+            text_anchor = 'start',
+            fill = 'grey',
+        )
+
+except OSError as e:
+    fatal(os_error(e))
@@ -29,9 +29,13 @@ __released__ = '2022-01-25'
 
 # Imports {{{1
 from svgwrite import Drawing
+from svgwrite.utils import pretty_xml
+from io import StringIO
 from pathlib import Path
+from collections import OrderedDict
 from math import ceil, floor, log10 as log, pi as π
 from quantiphy import Quantity
+import numpy as np
 
 Quantity.set_prefs(
     map_sf = Quantity.map_sf_to_sci_notation,
@@ -39,6 +43,92 @@ Quantity.set_prefs(
     output_sf = 'YZEPTGMkmunpfazy',
 )
 
+# Utilities {{{1
+# resample() {{{2
+def resample(frequencies, values, to_frequencies):
+    # Interpolate a trace onto a new set of frequencies.  Interpolation is
+    # linear in log-log space, which is exact for the straight R, L and C
+    # segments of an impedance plot.  values may be two dimensional, in which
+    # case each row is a trace given at frequencies.  Points that fall outside
+    # the span of frequencies, or that fall on or next to a non-positive value,
+    # are returned as NaN.  to_frequencies may be a scalar.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fs = np.log10(np.asarray(frequencies, dtype=float))
+        vs = np.log10(np.asarray(values, dtype=float))
+        ts = np.log10(np.asarray(to_frequencies, dtype=float))
+        assert fs.ndim == 1 and len(fs) >= 2, "need at least two frequencies."
+        assert vs.shape[-1] == len(fs), "frequencies and values differ in length."
+        order = np.argsort(fs, kind='stable')
+        fs = fs[order]
+        vs = vs[..., order]
+        assert np.all(np.diff(fs) > 0) and np.isfinite(fs[0]), \
+            "frequencies must be positive and distinct."
+
+        i = np.clip(np.searchsorted(fs, ts, side='right') - 1, 0, len(fs) - 2)
+        w = (ts - fs[i]) / (fs[i+1] - fs[i])
+        lo = vs[..., i]
+        hi = vs[..., i+1]
+        resampled = np.where(
+            w == 0, lo, np.where(w == 1, hi, lo + w*(hi - lo))
+        )
+        invalid = (
+            (~np.isfinite(lo) & (w != 1)) | (~np.isfinite(hi) & (w != 0))
+            | (ts < fs[0]) | (ts > fs[-1]) | np.isnan(ts)
+        )
+        return 10**np.where(invalid, np.nan, resampled)
+
+# valid_runs() {{{2
+def valid_runs(valid):
+    # Returns (start, stop) index pairs of the runs of consecutive true values
+    # in the boolean array valid.
+    edges = np.diff(np.concatenate(([0], np.asarray(valid, dtype=np.int8), [0])))
+    starts = np.flatnonzero(edges == 1).tolist()
+    stops = np.flatnonzero(edges == -1).tolist()
+    return list(zip(starts, stops))
+
+# ratio() {{{2
+def ratio(frequencies, values, ref_frequencies, ref_values):
+    # Ratio of a trace to a reference trace, evaluated at frequencies.
+    # The reference is resampled onto frequencies first.
+    ref = resample(ref_frequencies, ref_values, frequencies)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.asarray(values, dtype=float) / ref
+
+# residual() {{{2
+def residual(frequencies, values, ref_frequencies, ref_values):
+    # Magnitude of the difference between a trace and a reference trace,
+    # evaluated at frequencies.  The reference is resampled onto frequencies
+    # first.  The magnitude is returned so the result can be plotted as a trace.
+    ref = resample(ref_frequencies, ref_values, frequencies)
+    return np.abs(np.asarray(values, dtype=float) - ref)
+
+
+# line_endpoints() {{{2
+def line_endpoints(start, end, *, r=None, l=None, c=None, f=None):
+    # Frequency and impedance of the end points of a line of constant r, l, c,
+    # or f.  For r, l and c, start and end are frequencies; for f they are
+    # impedances.  Works with both scalars and arrays.
+    # Returns f_start, z_start, f_end, z_end.
+    if r is not None:
+        f_start, f_end = start, end
+        z_start = z_end = r
+    elif l is not None:
+        f_start, f_end = start, end
+        z_start = 2*π*start*l
+        z_end = 2*π*end*l
+    elif c is not None:
+        f_start, f_end = start, end
+        z_start = 1/(2*π*start*c)
+        z_end = 1/(2*π*end*c)
+    elif f is not None:
+        z_start = start
+        z_end = end
+        f_start = f_end = f
+    else:
+        raise AssertionError('must specify either r, l, c, or f.')
+    return f_start, z_start, f_end, z_end
+
+
 # RLC_Chart class {{{1
 class RLC_Chart(Drawing):
 
@@ -115,13 +205,14 @@ class RLC_Chart(Drawing):
 
         # coordinate transformations {{{3
         # coordinate transformations for base units (Hz, Ω)
+        # these accept either scalars or arrays
         def x(f):
-            x = log(f)
+            x = log(f) if np.isscalar(f) else np.log10(f)
             X = self.LEFT_MARGIN + grid_width*(x-x0)/(x1-x0)
             return to_pixels(X)
 
         def y(z):
-            y = log(z)
+            y = log(z) if np.isscalar(z) else np.log10(z)
             Y = canvas_height - self.BOTTOM_MARGIN - grid_height*(y-y0)/(y1-y0)
             return to_pixels(Y)
 
@@ -325,8 +416,13 @@ class RLC_Chart(Drawing):
         self.traces = self.g(id='traces')
         self.add(self.traces)
 
-    # add_trace() {{{2
-    def add_trace(self, frequencies, impedances, name=None, **svg_args):
+    # trace() {{{2
+    def trace(self, frequencies, impedances, **svg_args):
+        # Creates, but does not add, the element for a trace.  Points with
+        # a frequency or impedance that is not positive and finite are
+        # dropped and the trace is broken into separate segments at those
+        # points.  Isolated points are drawn as dots.  Returns the element,
+        # which is None if no points remain, and the number of points dropped.
 
         kwargs = dict(
             stroke = self.TRACE_COLOR,
@@ -336,16 +432,114 @@ class RLC_Chart(Drawing):
         )
         kwargs.update(svg_args)
 
-        self.traces.add(
-            self.polyline(
-                [
-                    (self.to_x(f), self.to_y(z))
-                    for f, z in zip(frequencies, impedances)
-                ],
-                clip_path = 'url(#plotting-region)',
-                **kwargs
+        frequencies = np.asarray(frequencies, dtype=float)
+        impedances = np.asarray(impedances, dtype=float)
+        assert frequencies.shape == impedances.shape, \
+            "frequencies and impedances differ in length."
+        with np.errstate(invalid='ignore'):
+            valid = (
+                np.isfinite(frequencies) & np.isfinite(impedances)
+                & (frequencies > 0) & (impedances > 0)
+            )
+        kept = np.flatnonzero(valid)
+        dropped = len(valid) - len(kept)
+        if dropped:
+            frequencies = frequencies[kept]
+            impedances = impedances[kept]
+        if not len(kept):
+            return None, dropped
+        points = [
+            (self.to_x(f), self.to_y(z))
+            for f, z in zip(frequencies.tolist(), impedances.tolist())
+        ]
+
+        if not dropped and len(points) > 1:
+            element = self.polyline(
+                points, clip_path='url(#plotting-region)', **kwargs
             )
+            return element, dropped
+
+        # split into segments wherever points were dropped; an isolated point
+        # is drawn as a zero length segment so its round cap shows as a dot
+        segments = []
+        offset = 0
+        for start, stop in valid_runs(valid):
+            segment = points[offset:offset + stop - start]
+            offset += stop - start
+            if len(segment) == 1:
+                segment = segment + segment
+            x0, y0 = segment[0]
+            segments.append(
+                f'M{x0},{y0} L' + ' '.join(f'{x},{y}' for x, y in segment[1:])
+            )
+        element = self.path(
+            d = ' '.join(segments), clip_path='url(#plotting-region)', **kwargs
         )
+        return element, dropped
+
+    # add_trace() {{{2
+    def add_trace(self, frequencies, impedances, name=None, **svg_args):
+        # returns the number of points dropped because they could not be
+        # plotted
+
+        element, dropped = self.trace(frequencies, impedances, **svg_args)
+        if element is not None:
+            self.traces.add(element)
+        return dropped
+
+    # add_band() {{{2
+    def add_band(self, frequencies, lower, upper, **svg_args):
+        # The band is broken at points that cannot be plotted, with one polygon
+        # for each contiguous run of valid points.  A run of a single point has
+        # no area, so it is dropped too.  Returns the number of points dropped.
+
+        kwargs = dict(
+            fill = self.TRACE_COLOR,
+            fill_opacity = 0.25,
+            stroke = 'none',
+        )
+        kwargs.update(svg_args)
+
+        frequencies = np.asarray(frequencies, dtype=float)
+        lower = np.asarray(lower, dtype=float)
+        upper = np.asarray(upper, dtype=float)
+        with np.errstate(invalid='ignore'):
+            valid = (
+                np.isfinite(frequencies) & np.isfinite(lower) & np.isfinite(upper)
+                & (frequencies > 0) & (lower > 0) & (upper > 0)
+            )
+        runs = [
+            (start, stop) for start, stop in valid_runs(valid) if stop - start > 1
+        ]
+        dropped = len(valid) - sum(stop - start for start, stop in runs)
+        frequencies = frequencies.tolist()
+        lower = lower.tolist()
+        upper = upper.tolist()
+
+        # one polygon for each run of valid points
+        for start, stop in runs:
+            fs = frequencies[start:stop]
+            self.traces.add(
+                self.polygon(
+                    [
+                        (self.to_x(f), self.to_y(z))
+                        for f, z in zip(fs, upper[start:stop])
+                    ] + [
+                        (self.to_x(f), self.to_y(z))
+                        for f, z in zip(reversed(fs), reversed(lower[start:stop]))
+                    ],
+                    clip_path = 'url(#plotting-region)',
+                    **kwargs
+                )
+            )
+        return dropped
+
+    # pixel_frequencies() {{{2
+    def pixel_frequencies(self):
+        # frequencies of the pixel columns that span the grid
+        decades = round(log(self.fmax) - log(self.fmin))
+        columns = round(self.to_pixels(self.DECADE*decades)) + 1
+        return np.logspace(log(self.fmin), log(self.fmax), columns)
 
     # add_line() {{{2
     def add_line(self, start, end, *, r=None, l=None, c=None, f=None, **svg_args):
@@ -358,23 +552,9 @@ class RLC_Chart(Drawing):
         )
         kwargs.update(svg_args)
 
-        if r is not None:
-            f_start, f_end = start, end
-            z_start = z_end = r
-        elif l is not None:
-            f_start, f_end = start, end
-            z_start = 2*π*start*l
-            z_end = 2*π*end*l
-        elif c is not None:
-            f_start, f_end = start, end
-            z_start = 1/(2*π*start*c)
-            z_end = 1/(2*π*end*c)
-        elif f is not None:
-            z_start = start
-            z_end = end
-            f_start = f_end = f
-        else:
-            raise AssertionError('must specify either r, l, c, or f.')
+        f_start, z_start, f_end, z_end = line_endpoints(
+            start, end, r=r, l=l, c=c, f=f
+        )
 
         self.traces.add(
             self.line(
@@ -384,6 +564,93 @@ class RLC_Chart(Drawing):
             )
         )
 
+    # add_lines() {{{2
+    def add_lines(self, start, end, *, r=None, l=None, c=None, f=None, **svg_args):
+        # Bulk version of add_line().  start, end and the component value may
+        # be arrays, which are broadcast against each other.  All lines are
+        # emitted as a single path.  Lines with an end point that cannot be
+        # plotted are skipped; the number skipped is returned.
+
+        kwargs = dict(
+            stroke = self.OUTLINE_LINE_COLOR,
+            stroke_width = self.to_pixels(self.OUTLINE_LINE_WIDTH),
+            stroke_linecap = 'round',
+            fill = 'none',
+        )
+        kwargs.update(svg_args)
+
+        def to_array(v):
+            return None if v is None else np.asarray(v, dtype=float)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            try:
+                endpoints = line_endpoints(
+                    to_array(start), to_array(end),
+                    r=to_array(r), l=to_array(l), c=to_array(c), f=to_array(f)
+                )
+                endpoints = np.broadcast_arrays(*endpoints)
+            except ValueError:
+                raise AssertionError(
+                    "start, end and component values differ in length."
+                )
+            endpoints = [np.ravel(v) for v in endpoints]
+            valid = np.logical_and.reduce(
+                [np.isfinite(v) & (v > 0) for v in endpoints]
+            )
+        f_start, z_start, f_end, z_end = [v[valid] for v in endpoints]
+        skipped = len(valid) - len(f_start)
+        if not len(f_start):
+            return skipped
+
+        lines = zip(
+            self.to_x(f_start).tolist(), self.to_y(z_start).tolist(),
+            self.to_x(f_end).tolist(), self.to_y(z_end).tolist(),
+        )
+        path = ' '.join(f'M{x0},{y0} {x1},{y1}' for x0, y0, x1, y1 in lines)
+        self.traces.add(self.path(d=path, **kwargs))
+        return skipped
+
+    # add_labels() {{{2
+    def add_labels(self, labels, frequencies, impedances, **svg_args):
+        # Adds many labels at once.  labels, frequencies and impedances are
+        # broadcast against each other.  The labels are placed at the given
+        # frequencies and impedances and share a single group that carries
+        # the text attributes.  Labels at a position that cannot be plotted
+        # are skipped; the number skipped is returned.
+
+        kwargs = dict(self.text_props)
+        kwargs.update(svg_args)
+
+        labels = np.asarray(labels, dtype=object)
+        frequencies = np.asarray(frequencies, dtype=float)
+        impedances = np.asarray(impedances, dtype=float)
+        try:
+            labels, frequencies, impedances = [
+                np.ravel(v)
+                for v in np.broadcast_arrays(labels, frequencies, impedances)
+            ]
+        except ValueError:
+            raise AssertionError(
+                "labels, frequencies and impedances differ in length."
+            )
+        with np.errstate(invalid='ignore'):
+            valid = (
+                np.isfinite(frequencies) & np.isfinite(impedances)
+                & (frequencies > 0) & (impedances > 0)
+            )
+        labels = labels[valid].tolist()
+        skipped = len(valid) - len(labels)
+        if not labels:
+            return skipped
+        xs = self.to_x(frequencies[valid]).tolist()
+        ys = self.to_y(impedances[valid]).tolist()
+
+        group = self.g(**kwargs)
+        for label, x, y in zip(labels, xs, ys):
+            group.add(self.text(str(label), insert=(x, y)))
+        self.traces.add(group)
+        return skipped
+
     # close() {{{2
     def close(self):
        self.save(pretty=True)
@@ -394,3 +661,98 @@ class RLC_Chart(Drawing):
 
     def __exit__(self, type, value, traceback):
         self.close()
+
+
+# RLC_Session class {{{1
+class RLC_Session:
+    # A session for tuning a model by hand.  The chart, the measured traces and
+    # their serialization are built once; when the model parameters change only
+    # the model trace is evaluated and rendered again.  Model evaluations are
+    # memoized by parameter set, the least recently used being evicted once
+    # there are more than MAX_EVALUATIONS.  The output is pretty printed and
+    # matches what RLC_Chart.close() writes had the model trace been added last.
+
+    # settings {{{2
+    MAX_EVALUATIONS = 64
+    MODEL_ID = 'rlc-session-model'
+
+    # constructor {{{2
+    def __init__(
+        self, filename, fmin, fmax, zmin, zmax, model, *,
+        frequencies=None, model_args=None, **kwargs
+    ):
+        self.filename = Path(filename)
+        self.chart = RLC_Chart(filename, fmin, fmax, zmin, zmax, **kwargs)
+        self.model = model
+        if frequencies is None:
+            frequencies = self.chart.pixel_frequencies()
+        self.frequencies = np.asarray(frequencies, dtype=float)
+        self.model_args = model_args or {}
+        self.evaluations = OrderedDict()
+        self.serialized = None
+
+    # add_trace() {{{2
+    def add_trace(self, frequencies, impedances, **svg_args):
+        self.invalidate()
+        return self.chart.add_trace(frequencies, impedances, **svg_args)
+
+    # invalidate() {{{2
+    def invalidate(self):
+        # call after modifying chart directly to rebuild its serialization
+        self.serialized = None
+
+    # evaluate() {{{2
+    def evaluate(self, **params):
+        # returns the rendered model trace for the given parameters
+        key = tuple(sorted(params.items()))
+        try:
+            self.evaluations.move_to_end(key)
+            return self.evaluations[key]
+        except KeyError:
+            pass
+
+        impedances = np.abs(self.model(self.frequencies, **params))
+        element, dropped = self.chart.trace(
+            self.frequencies, impedances, **self.model_args
+        )
+        if element is None:
+            trace = ''
+        else:
+            trace = pretty_xml(element.tostring()).strip()
+
+        self.evaluations[key] = trace
+        while len(self.evaluations) > self.MAX_EVALUATIONS:
+            self.evaluations.popitem(last=False)
+        return trace
+
+    # render() {{{2
+    def render(self, **params):
+        # returns the chart as an SVG string with the model trace for params
+        if self.serialized is None:
+            # serialize the chart with an empty placeholder group where the
+            # model trace goes and split it around the placeholder
+            placeholder = self.chart.g(id=self.MODEL_ID)
+            self.chart.traces.add(placeholder)
+            try:
+                buffer = StringIO()
+                self.chart.write(buffer, pretty=True)
+                svg = buffer.getvalue()
+            finally:
+                self.chart.traces.elements.remove(placeholder)
+            marker = f'<g id="{self.MODEL_ID}"/>\n'
+            start = svg.index(marker)
+            line_start = svg.rindex('\n', 0, start) + 1
+            self.serialized = (
+                svg[:line_start], svg[line_start:start], svg[start + len(marker):]
+            )
+        before, indent, after = self.serialized
+        trace = self.evaluate(**params)
+        if trace:
+            trace = indent + trace + '\n'
+        return before + trace + after
+
+    # save() {{{2
+    def save(self, **params):
+        # writes the chart with the model trace for params to filename
+        self.filename.write_text(self.render(**params), encoding='utf-8')
+        return self.filename
@@ -17,7 +17,7 @@ setup(
     license = 'GPLv3+',
     zip_safe = True,
     py_modules = 'rlc_chart'.split(),
-    install_requires = 'quantiphy svgwrite'.split(),
+    install_requires = 'numpy quantiphy svgwrite'.split(),
     python_requires = '>=3.6',
     classifiers = [
         'Development Status :: 5 - Production/Stable',